@@ -1,117 +1,32 @@
 import os
-from pathlib import Path
-from PIL import Image
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel,
                             QPushButton, QFileDialog, QMessageBox, QLineEdit,
                             QComboBox)
 from PyQt5.QtGui import QPixmap
-import time
-
-def compress_image(input_path, output_path, target_size_kb, min_quality=5, output_format='JPEG'):
-    """
-    使用二分法查找最佳压缩质量参数来压缩图片
-    Args:
-        input_path (str): 输入图片路径
-        output_path (str): 输出图片路径
-        target_size_kb (int): 目标文件大小（KB）
-        min_quality (int): 最低图片质量
-        output_format (str): 输出图片格式（JPEG, PNG, WEBP）
-    """
-    try:
-        target_size = target_size_kb * 1024
-        original_size = os.path.getsize(input_path)
-
-        if original_size <= target_size:
-            raise ValueError("原始文件已经小于目标大小，无需压缩")
-
-        img = Image.open(input_path)
-        if img.mode != 'RGB' and output_format == 'JPEG':
-            img = img.convert('RGB')
-        min_q = min_quality
-        max_q = 95
-        best_quality = None
-        while min_q <= max_q:
-            current_quality = (min_q + max_q) // 2
-            try:
-                # 这里不再保存中间结果
-                img.save(output_path, quality=current_quality, format=output_format)
-            except PermissionError:
-                # 尝试解除文件占用
-                for _ in range(3):
-                    try:
-                        img.save(output_path, quality=current_quality, format=output_format)
-                        break
-                    except:
-                        time.sleep(0.5)
-                else:
-                    raise PermissionError(f"文件被占用，无法保存：{output_path}")
+from PyQt5.QtCore import QThread, pyqtSignal
+from core import compress_image, process_directory
 
-            current_size = os.path.getsize(output_path)
+class CompressWorker(QThread):
+    """在后台线程中执行压缩（目录模式会再调度进程池），避免阻塞界面"""
+    # 完成后发出一次：错误信息，成功时为空字符串
+    done = pyqtSignal(str)
 
-            if current_size <= target_size:
-                best_quality = current_quality
-                min_q = current_quality + 1
-            else:
-                max_q = current_quality - 1
-
-        if best_quality is not None:
-            try:
-                # 只在找到最佳质量后保存最终结果
-                img.save(output_path, quality=best_quality, format=output_format)
-            except PermissionError:
-                # 尝试解除文件占用
-                for _ in range(3):
-                    try:
-                        img.save(output_path, quality=best_quality, format=output_format)
-                        break
-                    except:
-                        time.sleep(0.5)
-                else:
-                    raise PermissionError(f"文件被占用，无法保存：{output_path}")
-            final_size = os.path.getsize(output_path)
-            print(f"压缩完成：")
-            print(f"原始大小: {original_size/1024:.1f}KB")
-            print(f"目标大小: {target_size/1024:.1f}KB")
-            print(f"最终大小: {final_size/1024:.1f}KB")
-            print(f"使用的质量参数: {best_quality}")
-
-    except Exception as e:
-        raise Exception(f"压缩过程中出错: {str(e)}")
-
-def process_directory(input_dir, output_dir, target_size_kb, min_quality=5, output_format='JPEG'):
-    """
-    处理整个目录中的图片，并支持格式转换
-
-    Args:
-        input_dir (str): 输入目录路径
-        output_dir (str): 输出目录路径
-        target_size_kb (int): 目标文件大小（KB）
-        min_quality (int): 最低图片质量
-        output_format (str): 输出图片格式（JPEG, PNG, WEBP）
-    """
-    input_path = Path(input_dir)
-    output_path = Path(output_dir)
-
-    output_path.mkdir(parents=True, exist_ok=True)
-
-    image_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
-
-    for img_path in input_path.rglob('*'):
-        if img_path.suffix.lower() in image_extensions:
-            relative_path = img_path.relative_to(input_path)
-            output_file = output_path / relative_path.with_suffix(f'.{output_format.lower()}')
-
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-
-            print(f"\n处理文件: {relative_path}")
-            try:
-                compress_image(str(img_path), str(output_file), target_size_kb, min_quality, output_format)
-            except Exception as e:
-                print(f"处理 {relative_path} 时出错: {e}")
+    def __init__(self, func, args, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+
+    def run(self):
+        try:
+            self.func(*self.args)
+            self.done.emit('')
+        except Exception as e:
+            self.done.emit(str(e))
 
 class ImageCompressorApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.worker = None
         self.initUI()
 
     def initUI(self):
@@ -235,17 +150,36 @@ class ImageCompressorApp(QWidget):
                 if not os.access(output_dir, os.W_OK):
                     raise PermissionError(f"无权限写入输出目录：{output_dir}")
 
-                compress_image(input_path, output_file, target_size_kb, min_quality, output_format)
+                func, args = compress_image, (input_path, output_file, target_size_kb, min_quality, output_format)
             else:
                 # 检查输出目录权限
                 if not os.access(output_path, os.W_OK):
                     raise PermissionError(f"无权限写入输出目录：{output_path}")
                 
-                process_directory(input_path, output_path, target_size_kb, min_quality, output_format)
-
-            QMessageBox.information(self, '成功', '图片压缩完成！')
+                func, args = process_directory, (input_path, output_path, target_size_kb, min_quality, output_format)
         except Exception as e:
             QMessageBox.critical(self, '错误', str(e))
+            return
+
+        self.compress_button.setEnabled(False)
+        self.worker = CompressWorker(func, args, self)
+        self.worker.done.connect(self.on_compression_done)
+        self.worker.start()
+
+    def on_compression_done(self, error):
+        self.compress_button.setEnabled(True)
+        if error:
+            QMessageBox.critical(self, '错误', error)
+        else:
+            QMessageBox.information(self, '成功', '图片压缩完成！')
+
+    def closeEvent(self, event):
+        # 销毁仍在运行的 QThread 会导致程序崩溃，压缩完成前不允许关闭窗口
+        if self.worker is not None and self.worker.isRunning():
+            QMessageBox.warning(self, '提示', '正在压缩图片，请等待完成后再关闭')
+            event.ignore()
+            return
+        super().closeEvent(event)
 
 if __name__ == '__main__':
     app = QApplication([])
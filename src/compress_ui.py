@@ -1,12 +1,31 @@
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from PIL import Image
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QPushButton, QFileDialog, QMessageBox, 
-                            QLineEdit, QComboBox, QGridLayout, QScrollArea)
-from PyQt5.QtGui import QPixmap, QDragEnterEvent, QDropEvent
-from PyQt5.QtCore import Qt, QMimeData
-import time
+                            QLineEdit, QComboBox, QGridLayout, QScrollArea,
+                            QProgressBar)
+from PyQt5.QtGui import QPixmap, QImage, QDragEnterEvent, QDropEvent
+from PyQt5.QtCore import Qt, QMimeData, QThread, pyqtSignal
+from core import IMAGE_NAME_RE, compress_image, init_worker
+
+def _fast_thumb(path, size=100):
+    """
+    生成缩略图：利用 libjpeg 的 draft 模式在解码时直接缩小，避免解码完整分辨率
+    """
+    try:
+        with Image.open(path) as im:
+            im.draft('RGB', (size * 2, size * 2))
+            im.thumbnail((size, size), Image.BILINEAR)
+            # 保留 alpha 通道，透明 PNG/WEBP 的缩略图才能正常显示透明区域
+            im = im.convert('RGBA')
+    except Exception:
+        return QPixmap()
+    data = im.tobytes('raw', 'RGBA')
+    qimg = QImage(data, im.width, im.height, im.width * 4, QImage.Format_RGBA8888)
+    return QPixmap.fromImage(qimg)
 
 class DragDropWidget(QWidget):
     def __init__(self, parent=None):
@@ -41,15 +60,46 @@ class DragDropWidget(QWidget):
     def dropEvent(self, event: QDropEvent):
         urls = event.mimeData().urls()
         files = [url.toLocalFile() for url in urls if url.isLocalFile()]
-        valid_files = [f for f in files if Path(f).suffix.lower() in {'.jpg', '.jpeg', '.png', '.webp'}]
+        valid_files = [f for f in files if IMAGE_NAME_RE.search(f)]
         if valid_files:
             self.parent().add_thumbnails(valid_files)
         event.acceptProposedAction()
 
+class CompressWorker(QThread):
+    """在后台线程中调度进程池压缩图片，避免阻塞界面"""
+    # 每完成一张图片发出一次：(已完成数量, 总数量)
+    progress = pyqtSignal(int, int)
+    # 全部完成后发出一次：[(文件名, 错误信息), ...]
+    done = pyqtSignal(list)
+
+    def __init__(self, tasks, parent=None):
+        super().__init__(parent)
+        self.tasks = tasks
+
+    def run(self):
+        errors = []
+        total = len(self.tasks)
+        with ProcessPoolExecutor(initializer=init_worker,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(_compress_file, *task): task[0] for task in self.tasks}
+            for finished, future in enumerate(as_completed(futures), 1):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append((os.path.basename(futures[future]), str(e)))
+                self.progress.emit(finished, total)
+        self.done.emit(errors)
+
 class ImageCompressorApp(QWidget):
+    max_col = 4  # 每行显示4个缩略图
+
     def __init__(self):
         super().__init__()
         self.image_paths = []
+        self._path_to_container = {}
+        self.worker = None
+        # 缩略图缓存，键为 (路径, 修改时间)
+        self._thumb_cache = {}
         self.initUI()
 
     def initUI(self):
@@ -77,6 +127,20 @@ class ImageCompressorApp(QWidget):
             QPushButton:hover {
                 background-color: #45a049;
             }
+            QLabel#thumb {
+                border: 2px solid #ddd;
+                border-radius: 5px;
+                padding: 2px;
+            }
+            QPushButton#closeBtn {
+                font-size: 16px;
+                color: white;
+                background-color: #ff4444;
+                border-radius: 10px;
+            }
+            QPushButton#closeBtn:hover {
+                background-color: #cc0000;
+            }
         """)
 
         # 主布局
@@ -111,10 +175,15 @@ class ImageCompressorApp(QWidget):
         self.compress_button.setStyleSheet("font-size: 16px; padding: 12px 24px;")
         self.compress_button.clicked.connect(self.start_compression)
 
+        # 压缩进度
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+
         # 组装界面
         main_layout.addLayout(params_layout)
         main_layout.addWidget(self.scroll_area)
         main_layout.addWidget(self.compress_button)
+        main_layout.addWidget(self.progress_bar)
 
         self.setLayout(main_layout)
         self.center_window()
@@ -132,9 +201,6 @@ class ImageCompressorApp(QWidget):
             self.add_thumbnails(files)
 
     def add_thumbnails(self, files):
-        row = col = 0
-        max_col = 4  # 每行显示4个缩略图
-
         for path in files:
             if path in self.image_paths:
                 continue
@@ -142,28 +208,22 @@ class ImageCompressorApp(QWidget):
             # 添加缩略图
             thumbnail = QLabel()
             thumbnail.setFixedSize(100, 100)
-            pixmap = QPixmap(path).scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            try:
+                key = (path, os.path.getmtime(path))
+            except OSError:
+                # 文件已不存在或无法访问时显示空白缩略图
+                pixmap = QPixmap()
+            else:
+                pixmap = self._thumb_cache.get(key)
+                if pixmap is None:
+                    pixmap = self._thumb_cache[key] = _fast_thumb(path)
             thumbnail.setPixmap(pixmap)
-            thumbnail.setStyleSheet("""
-                border: 2px solid #ddd;
-                border-radius: 5px;
-                padding: 2px;
-            """)
+            thumbnail.setObjectName("thumb")
 
             # 添加删除按钮
             close_btn = QPushButton("×")
             close_btn.setFixedSize(20, 20)
-            close_btn.setStyleSheet("""
-                QPushButton {
-                    font-size: 16px;
-                    color: white;
-                    background-color: #ff4444;
-                    border-radius: 10px;
-                }
-                QPushButton:hover {
-                    background-color: #cc0000;
-                }
-            """)
+            close_btn.setObjectName("closeBtn")
             close_btn.clicked.connect(lambda _, p=path: self.remove_image(p))
 
             # 容器布局
@@ -173,152 +233,77 @@ class ImageCompressorApp(QWidget):
             container_layout.addWidget(close_btn, 0, Qt.AlignCenter)
             container_layout.setContentsMargins(0, 0, 0, 0)
 
+            row, col = divmod(len(self.image_paths), self.max_col)
             self.thumbnails_layout.addWidget(container, row, col)
             self.image_paths.append(path)
-
-            col += 1
-            if col >= max_col:
-                col = 0
-                row += 1
+            self._path_to_container[path] = container
 
     def remove_image(self, path):
-        self.image_paths.remove(path)
-        # 重新加载所有缩略图
-        self.clear_thumbnails()
-        self.add_thumbnails(self.image_paths)
-
-    def clear_thumbnails(self):
-        while self.thumbnails_layout.count():
-            item = self.thumbnails_layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
+        index = self.image_paths.index(path)
+        self.image_paths.pop(index)
+        container = self._path_to_container.pop(path)
+        self.thumbnails_layout.removeWidget(container)
+        container.deleteLater()
+        # 只移动其后的缩略图，无需重新生成
+        for i in range(index, len(self.image_paths)):
+            row, col = divmod(i, self.max_col)
+            self.thumbnails_layout.addWidget(self._path_to_container[self.image_paths[i]], row, col)
 
     def start_compression(self):
         # 创建压缩图片文件夹
         output_dir = Path("compressed_images")
         output_dir.mkdir(parents=True, exist_ok=True)
 
+        target_size_kb = int(self.size_entry.text())
+        min_quality = int(self.quality_entry.text() or "5")
+        output_format = self.format_var.currentText()
+
+        tasks = []
         for input_path in self.image_paths:
             input_filename = os.path.basename(input_path)
             output_file = output_dir / f"compressed_{input_filename}"
-
-            target_size_kb = int(self.size_entry.text())
-            min_quality = int(self.quality_entry.text() or "5")
-            output_format = self.format_var.currentText()
-
-            try:
-                compress_image(input_path, str(output_file), target_size_kb, min_quality, output_format)
-                # 检查压缩后的文件大小
-                final_size_kb = os.path.getsize(output_file) / 1024
-                if final_size_kb < target_size_kb:
-                    print(f"警告: {input_filename} 压缩后大小 {final_size_kb:.1f}KB 小于目标大小 {target_size_kb}KB")
-            except Exception as e:
-                QMessageBox.critical(self, '错误', str(e))
-
-        QMessageBox.information(self, '成功', '所有图片压缩完成！')
-
-def compress_image(input_path, output_path, target_size_kb, min_quality=5, output_format='JPEG'):
+            tasks.append((input_path, str(output_file), target_size_kb, min_quality, output_format))
+
+        self.compress_button.setEnabled(False)
+        self.progress_bar.setRange(0, len(tasks))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+
+        self.worker = CompressWorker(tasks, self)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.done.connect(self.on_compression_done)
+        self.worker.start()
+
+    def on_progress(self, finished, total):
+        self.progress_bar.setValue(finished)
+
+    def on_compression_done(self, errors):
+        self.compress_button.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        if errors:
+            succeeded = len(self.worker.tasks) - len(errors)
+            details = '\n'.join(f"{name}: {error}" for name, error in errors)
+            QMessageBox.critical(self, '错误', f"{succeeded} 张图片压缩成功，{len(errors)} 张失败：\n{details}")
+        else:
+            QMessageBox.information(self, '成功', '所有图片压缩完成！')
+
+    def closeEvent(self, event):
+        # 销毁仍在运行的 QThread 会导致程序崩溃，压缩完成前不允许关闭窗口
+        if self.worker is not None and self.worker.isRunning():
+            QMessageBox.warning(self, '提示', '正在压缩图片，请等待完成后再关闭')
+            event.ignore()
+            return
+        super().closeEvent(event)
+
+def _compress_file(input_path, output_file, target_size_kb, min_quality, output_format):
     """
-    使用二分法查找最佳压缩质量参数来压缩图片
-    Args:
-        input_path (str): 输入图片路径
-        output_path (str): 输出图片路径
-        target_size_kb (int): 目标文件大小（KB）
-        min_quality (int): 最低图片质量
-        output_format (str): 输出图片格式（JPEG, PNG, WEBP）
+    压缩界面中选中的单张图片，供进程池调用（必须是模块级函数才能被序列化）
     """
-    try:
-        target_size = target_size_kb * 1024
-        original_size = os.path.getsize(input_path)
-
-        if original_size <= target_size:
-            raise ValueError("原始文件已经小于目标大小，无需压缩")
-
-        img = Image.open(input_path)
-        if img.mode != 'RGB' and output_format == 'JPEG':
-            img = img.convert('RGB')
-        min_q = min_quality
-        max_q = 95
-        best_quality = None
-        while min_q <= max_q:
-            current_quality = (min_q + max_q) // 2
-            try:
-                # 这里不再保存中间结果
-                img.save(output_path, quality=current_quality, format=output_format)
-            except PermissionError:
-                # 尝试解除文件占用
-                for _ in range(3):
-                    try:
-                        img.save(output_path, quality=current_quality, format=output_format)
-                        break
-                    except:
-                        time.sleep(0.5)
-                else:
-                    raise PermissionError(f"文件被占用，无法保存：{output_path}")
-
-            current_size = os.path.getsize(output_path)
-
-            if current_size <= target_size:
-                best_quality = current_quality
-                min_q = current_quality + 1
-            else:
-                max_q = current_quality - 1
-
-        if best_quality is not None:
-            try:
-                # 只在找到最佳质量后保存最终结果
-                img.save(output_path, quality=best_quality, format=output_format)
-            except PermissionError:
-                # 尝试解除文件占用
-                for _ in range(3):
-                    try:
-                        img.save(output_path, quality=best_quality, format=output_format)
-                        break
-                    except:
-                        time.sleep(0.5)
-                else:
-                    raise PermissionError(f"文件被占用，无法保存：{output_path}")
-            final_size = os.path.getsize(output_path)
-            print(f"压缩完成：")
-            print(f"原始大小: {original_size/1024:.1f}KB")
-            print(f"目标大小: {target_size/1024:.1f}KB")
-            print(f"最终大小: {final_size/1024:.1f}KB")
-            print(f"使用的质量参数: {best_quality}")
-
-    except Exception as e:
-        raise Exception(f"压缩过程中出错: {str(e)}")
-
-def process_directory(input_dir, output_dir, target_size_kb, min_quality=5, output_format='JPEG'):
-    """
-    处理整个目录中的图片，并支持格式转换
-
-    Args:
-        input_dir (str): 输入目录路径
-        output_dir (str): 输出目录路径
-        target_size_kb (int): 目标文件大小（KB）
-        min_quality (int): 最低图片质量
-        output_format (str): 输出图片格式（JPEG, PNG, WEBP）
-    """
-    input_path = Path(input_dir)
-    output_path = Path(output_dir)
-
-    output_path.mkdir(parents=True, exist_ok=True)
-
-    image_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
-
-    for img_path in input_path.rglob('*'):
-        if img_path.suffix.lower() in image_extensions:
-            relative_path = img_path.relative_to(input_path)
-            output_file = output_path / relative_path.with_suffix(f'.{output_format.lower()}')
-
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-
-            print(f"\n处理文件: {relative_path}")
-            try:
-                compress_image(str(img_path), str(output_file), target_size_kb, min_quality, output_format)
-            except Exception as e:
-                print(f"处理 {relative_path} 时出错: {e}")
+    compress_image(input_path, output_file, target_size_kb, min_quality, output_format)
+    # 检查压缩后的文件大小
+    final_size_kb = os.path.getsize(output_file) / 1024
+    if final_size_kb < target_size_kb:
+        print(f"警告: {os.path.basename(input_path)} 压缩后大小 {final_size_kb:.1f}KB 小于目标大小 {target_size_kb}KB")
 
 if __name__ == '__main__':
     app = QApplication([])
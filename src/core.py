@@ -0,0 +1,310 @@
+import io
+import math
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+try:
+    # 可选加速：直接调用 libjpeg-turbo 编码 JPEG
+    import numpy as np
+    from turbojpeg import TurboJPEG, TJPF_GRAY, TJPF_RGB, TJSAMP_GRAY, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+# 按文件名后缀匹配图片，忽略大小写，无需为每个文件生成小写后缀字符串
+IMAGE_NAME_RE = re.compile(r'\.(?:jpe?g|png|webp)\Z', re.IGNORECASE)
+
+# 本工具处理的是用户自己的图片，关闭 Pillow 针对超大图片的解压炸弹保护
+Image.MAX_IMAGE_PIXELS = None
+
+# 每个线程复用一个 TurboJPEG 句柄，避免每张图片重复加载动态库和分配缓冲区
+_TJ = threading.local()
+
+def _tj():
+    """
+    返回当前线程的 TurboJPEG 句柄，未安装 PyTurboJPEG 或找不到动态库时返回 None
+    """
+    if not hasattr(_TJ, 'handle'):
+        _TJ.handle = None
+        if TurboJPEG is not None:
+            try:
+                _TJ.handle = TurboJPEG()
+            except (OSError, RuntimeError):
+                # 找不到 libturbojpeg 动态库时退回 Pillow
+                pass
+    return _TJ.handle
+
+def init_worker():
+    """进程池初始化：每个工作进程预先创建自己的 TurboJPEG 句柄"""
+    _tj()
+
+def _to_jpeg_mode(img):
+    """
+    将图片转换为 JPEG 可直接编码的模式
+    灰度图保持单通道，每次编码只需处理 RGB 三分之一的数据；其余模式转换为 RGB
+    （Pillow 的 RGBA -> RGB 只丢弃 alpha 通道，不做混合，无需先判断是否全不透明）
+    """
+    if img.mode in ('RGB', 'L'):
+        return img
+    if img.mode == 'LA':
+        return img.convert('L')
+    return img.convert('RGB')
+
+def _make_encoder(img, output_format):
+    """
+    返回按质量参数将图片编码到内存的函数，编码结果为 bytes 类对象
+    输出 JPEG 且安装了 PyTurboJPEG 时直接调用 libjpeg-turbo 编码
+    """
+    jpeg = _tj() if output_format == 'JPEG' else None
+    if jpeg is not None:
+        pixels = np.asarray(img)
+        if img.mode == 'L':
+            pixel_format, subsample = TJPF_GRAY, TJSAMP_GRAY
+        else:
+            pixel_format, subsample = TJPF_RGB, TJSAMP_420
+        return lambda quality: jpeg.encode(pixels, quality=quality,
+                                           pixel_format=pixel_format, jpeg_subsample=subsample)
+
+    def encode(quality):
+        buf = io.BytesIO()
+        img.save(buf, quality=quality, format=output_format)
+        return buf.getbuffer()
+    return encode
+
+def _search_quality(encode_fn, target_size, min_quality, max_quality=95, known=None):
+    """
+    查找不超过目标大小的最高质量参数
+
+    文件大小与质量参数近似满足 size ≈ a·exp(b·q)，即 log(size) 与 q 近似线性。
+    先在 q=40 和 q=80 试探编码，之后每一步都在已知的达标质量与超出目标的质量之间，
+    按 log(size) 线性插值预测下一个质量参数，直到两者相邻；结果与二分查找一致，
+    但通常需要的编码次数更少。大小不随质量变化时（PNG 等格式）退化为二分查找。
+    预测未能把区间缩小一半时下一步改用二分，且总编码次数不超过二分查找所需次数加一
+
+    Args:
+        known (dict): 调用方已完成的编码结果 {质量参数: 编码结果}，直接作为已知点使用
+
+    Returns:
+        tuple: (质量参数, 编码结果)，无法达到目标大小时为 (None, None)
+    """
+    sizes = {}
+    best_quality = None
+    best_data = None
+    encodes = 0
+
+    def record(quality, data):
+        nonlocal best_quality, best_data
+        sizes[quality] = len(data)
+        if sizes[quality] <= target_size and (best_quality is None or quality > best_quality):
+            best_quality, best_data = quality, data
+
+    def encode(quality):
+        nonlocal encodes
+        if quality not in sizes:
+            encodes += 1
+            record(quality, encode_fn(quality))
+        return sizes[quality]
+
+    for quality, data in (known or {}).items():
+        record(quality, data)
+
+    budget = math.ceil(math.log2(max_quality - min_quality + 1)) + 1 if max_quality >= min_quality else 0
+    low_q = max(min_quality, 40)
+    high_q = max(low_q + 1, 80)
+    if target_size > 0 and high_q <= max_quality:
+        encode(low_q)
+        encode(high_q)
+
+    model_width = None
+    while True:
+        # lo 为已知达标的最高质量，hi 为其上方已知超出目标的最低质量（未知时取区间外一位）
+        lo = max((q for q, size in sizes.items() if size <= target_size), default=min_quality - 1)
+        hi = min((q for q, size in sizes.items() if size > target_size and q > lo), default=max_quality + 1)
+        if hi - lo <= 1:
+            break
+
+        # 上一步预测没能把区间缩小一半（拟合较差，在逐步逼近），或再做一次预测后剩余
+        # 区间的二分会超出编码次数上限时，本步改用二分
+        use_model = (model_width is None or (hi - lo) * 2 <= model_width) and \
+            encodes + 1 + math.ceil(math.log2(hi - lo - 1)) <= budget
+
+        # 选两个已知点拟合：优先用区间两端，否则用已知一端及其最近的点外推
+        if lo in sizes and hi in sizes:
+            p, r = lo, hi
+        else:
+            end = lo if lo in sizes else hi
+            nearest = sorted(sizes, key=lambda q: abs(q - end))[:2]
+            p, r = (min(nearest), max(nearest)) if len(nearest) == 2 else (None, None)
+
+        if use_model and p is not None and target_size > 0 and sizes[r] > sizes[p]:
+            t = (math.log(target_size) - math.log(sizes[p])) / (math.log(sizes[r]) - math.log(sizes[p]))
+            current_quality = round(p + t * (r - p))
+            model_width = hi - lo
+        else:
+            current_quality = (lo + hi) // 2
+            model_width = None
+        encode(min(max(current_quality, lo + 1), hi - 1))
+
+    return best_quality, best_data
+
+def _write_file(path, data):
+    """
+    将编码结果一次性写入磁盘（无缓冲写入，数据不经过额外的缓冲区拷贝）
+    先写入临时文件再原子替换，目标文件被占用或写入中断时不会留下半个文件
+    """
+    # 临时文件名唯一，并行压缩到同一输出路径的进程不会互相覆盖临时文件；
+    # 以 0o666 创建，由系统按 umask 得到与普通新建文件一致的权限
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb', buffering=0) as f:
+            view = memoryview(data)
+            while view:
+                view = view[f.write(view):]
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def compress_image(input_path, output_path, target_size_kb, min_quality=5, output_format='JPEG', original_size=None):
+    """
+    根据质量-大小模型预测最佳压缩质量参数来压缩图片
+    Args:
+        input_path (str): 输入图片路径
+        output_path (str): 输出图片路径
+        target_size_kb (int): 目标文件大小（KB）
+        min_quality (int): 最低图片质量
+        output_format (str): 输出图片格式（JPEG, PNG, WEBP）
+        original_size (int): 原始文件大小（字节），已知时传入可省去一次 stat
+    """
+    try:
+        target_size = target_size_kb * 1024
+        if original_size is None:
+            original_size = os.path.getsize(input_path)
+
+        if original_size <= target_size:
+            raise ValueError("原始文件已经小于目标大小，无需压缩")
+
+        img = Image.open(input_path)
+        original_dimensions = img.size
+        best_quality = best_data = None
+        # 无损优化通常只能减小 15%~25%，目标远小于原图时注定失败，直接进入质量查找
+        if img.format == 'JPEG' and output_format == 'JPEG' and target_size >= 0.75 * original_size:
+            # 先沿用原图的量化表，只做渐进式编码和霍夫曼表优化，达标则无需有损重压缩
+            buf = io.BytesIO()
+            img.save(buf, format='JPEG', quality='keep', subsampling='keep', optimize=True, progressive=True)
+            if buf.tell() <= target_size:
+                best_quality, best_data = 'keep', buf.getbuffer()
+
+        if best_data is None:
+            if output_format == 'JPEG':
+                img = _to_jpeg_mode(img)
+            # 提前解码一次，后续每次编码都复用已解码的像素
+            img.load()
+            encode = _make_encoder(img, output_format)
+            # 最低质量下仍超出目标大小时逐步缩小尺寸，避免在全分辨率上做注定失败的质量查找
+            probe = encode(min_quality)
+            while target_size > 0 and min(img.size) > 1 and len(probe) > target_size:
+                img = img.resize((img.width * 3 // 4 or 1, img.height * 3 // 4 or 1), Image.BILINEAR)
+                encode = _make_encoder(img, output_format)
+                probe = encode(min_quality)
+            if output_format == 'PNG':
+                # PNG 的大小与质量参数无关，最低质量的试探结果就是最终结果
+                if len(probe) <= target_size:
+                    best_quality, best_data = min_quality, probe
+            else:
+                # 最低质量的试探结果交给查找过程复用，无需重新编码
+                best_quality, best_data = _search_quality(encode, target_size, min_quality,
+                                                          known={min_quality: probe})
+
+        if best_quality is not None:
+            # 只在找到最佳质量后写入一次最终结果
+            _write_file(output_path, best_data)
+            final_size = len(best_data)
+            print(f"压缩完成：")
+            print(f"原始大小: {original_size/1024:.1f}KB")
+            print(f"目标大小: {target_size/1024:.1f}KB")
+            print(f"最终大小: {final_size/1024:.1f}KB")
+            print(f"使用的质量参数: {best_quality}")
+            if img.size != original_dimensions:
+                print(f"输出尺寸已缩小为: {img.width}x{img.height}")
+
+    except Exception as e:
+        raise Exception(f"压缩过程中出错: {str(e)}")
+
+def _compress_one(task):
+    """
+    压缩目录中的单个文件，供进程池调用（必须是模块级函数才能被序列化）
+
+    Args:
+        task (tuple): (输入路径, 输出路径, 相对路径, 原始大小, 目标大小KB, 最低质量, 输出格式)
+    """
+    img_path, output_file, relative_path, original_size, target_size_kb, min_quality, output_format = task
+    print(f"\n处理文件: {relative_path}")
+    try:
+        compress_image(img_path, output_file, target_size_kb, min_quality, output_format, original_size)
+    except Exception as e:
+        print(f"处理 {relative_path} 时出错: {e}")
+
+def _walk(root):
+    """
+    递归遍历目录，逐个产出图片文件的 os.DirEntry（DirEntry 会缓存 stat 结果）
+    """
+    try:
+        entries = os.scandir(root)
+    except PermissionError:
+        # 与 Path.rglob 一致：跳过无权限访问的目录
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path)
+            elif IMAGE_NAME_RE.search(entry.name) and entry.is_file():
+                yield entry
+
+def process_directory(input_dir, output_dir, target_size_kb, min_quality=5, output_format='JPEG'):
+    """
+    处理整个目录中的图片，并支持格式转换
+
+    Args:
+        input_dir (str): 输入目录路径
+        output_dir (str): 输出目录路径
+        target_size_kb (int): 目标文件大小（KB）
+        min_quality (int): 最低图片质量
+        output_format (str): 输出图片格式（JPEG, PNG, WEBP）
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    # 记录已创建的输出目录，同一目录下的文件不再重复 mkdir
+    created_dirs = {output_path}
+
+    tasks = []
+    # 不同输入可能映射到同一输出（如 b.jpeg 与 b.png），并行压缩时结果取决于完成顺序，只保留第一个
+    queued_outputs = {}
+    for entry in _walk(input_dir):
+        relative_path = Path(entry.path).relative_to(input_path)
+        output_file = output_path / relative_path.with_suffix(f'.{output_format.lower()}')
+        if output_file in queued_outputs:
+            print(f"跳过 {relative_path}：输出文件与 {queued_outputs[output_file]} 相同")
+            continue
+        queued_outputs[output_file] = relative_path
+
+        parent = output_file.parent
+        if parent not in created_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(parent)
+
+        tasks.append((entry.path, str(output_file), relative_path, entry.stat().st_size,
+                      target_size_kb, min_quality, output_format))
+
+    # 各图片相互独立且编码受 CPU 限制，使用多进程并行压缩
+    with ProcessPoolExecutor(initializer=init_worker,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        list(executor.map(_compress_one, tasks))